@@ -3,29 +3,67 @@ import os
 import tempfile
 from pathlib import Path
 import io
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import pandas as pd
 import json
+from collections import OrderedDict
+import hashlib
+import uuid
+import numpy as np
 
 # Updated LangChain imports
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
 from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
+from langchain.chains import create_history_aware_retriever, create_retrieval_chain
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain.memory import ConversationBufferWindowMemory
 from langchain.schema import Document
 from langchain.prompts import PromptTemplate
+from langchain.globals import get_llm_cache, set_llm_cache
+from langchain_core.caches import InMemoryCache
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
 
-# Docling imports
-from docling.document_converter import DocumentConverter, PdfFormatOption
-from docling.datamodel.base_models import InputFormat
-from docling.datamodel.pipeline_options import (
-    PdfPipelineOptions, 
-    TableFormerMode,
-    AcceleratorOptions
-)
-from docling.backend.pypdfium2_backend import PyPdfiumDocumentBackend
-from docling.utils.export import generate_multimodal_pages
+# Docling and FAISS are imported inside the methods that use them, so the
+# page renders before their heavy native extensions are loaded
+
+# Embedding batching (Gemini embedding API)
+EMBED_BATCH_SIZE = 100
+EMBED_BATCH_CHAR_BUDGET = 20000  # ~5k tokens per request
+EMBED_MAX_CONCURRENCY = 8
+
+# Docling converter settings
+DOCLING_NUM_THREADS = os.cpu_count() or 4
+DOCLING_TABLE_MODE = "fast"
+DOCLING_IMAGES_SCALE = 1.0
+
+# Minimum first-page text length for a PDF to be treated as text-based (no OCR)
+OCR_TEXT_THRESHOLD = 50
+
+# Segments shorter than this (page numbers, headers) are not kept
+MIN_SEGMENT_CHARS = 40
+
+# HNSW graph parameters for the FAISS index
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+# Minimum vectors needed to train the 8-bit scalar quantizer
+SQ_MIN_TRAINING_VECTORS = 256
+
+# On-disk caches for FAISS indexes and per-chunk embeddings
+CACHE_DIR = Path("cache")
+INDEX_CACHE_DIR = CACHE_DIR / "faiss_hnsw_sq8"
+EMBEDDING_CACHE_DIR = CACHE_DIR / "emb"
+
+# Cache size limits (entries)
+LLM_CACHE_SIZE = 256
+RESPONSE_CACHE_SIZE = 32
+
+# Process-wide LLM cache for identical prompts (e.g. repeated sample questions).
+# Streamlit re-runs this script on every interaction, so only install it once.
+if get_llm_cache() is None:
+    set_llm_cache(InMemoryCache(maxsize=LLM_CACHE_SIZE))
 
 # Page configuration
 st.set_page_config(
@@ -76,6 +114,60 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def initialize_converter(do_ocr, num_threads, table_mode, images_scale):
+    """Initialize the Docling document converter, shared across sessions"""
+    from docling.document_converter import DocumentConverter, PdfFormatOption
+    from docling.datamodel.base_models import InputFormat
+    from docling.datamodel.pipeline_options import (
+        PdfPipelineOptions,
+        TableFormerMode,
+        AcceleratorOptions,
+        AcceleratorDevice
+    )
+    from docling.backend.pypdfium2_backend import PyPdfiumDocumentBackend
+    
+    pipeline_options = PdfPipelineOptions()
+    pipeline_options.do_ocr = do_ocr
+    pipeline_options.do_table_structure = True
+    pipeline_options.table_structure_options.mode = TableFormerMode(table_mode)
+    pipeline_options.table_structure_options.do_cell_matching = True
+    pipeline_options.accelerator_options = AcceleratorOptions(
+        num_threads=num_threads,
+        device=AcceleratorDevice.AUTO
+    )
+    # Only the markdown export is used, so skip rendering page bitmaps
+    pipeline_options.images_scale = images_scale
+    pipeline_options.generate_page_images = False
+
+    return DocumentConverter(
+        format_options={
+            InputFormat.PDF: PdfFormatOption(
+                pipeline_options=pipeline_options,
+                backend=PyPdfiumDocumentBackend
+            )
+        }
+    )
+
+@st.cache_resource
+def get_conversion_executor():
+    """Create the process-wide Docling worker, shared across sessions"""
+    # Single worker so conversions never run side by side, each using all cores
+    return ThreadPoolExecutor(max_workers=1)
+
+@st.cache_resource
+def get_embeddings(api_key):
+    """Create the Gemini embeddings client, shared across sessions per API key"""
+    # Reuse stored vectors for any chunk text embedded before
+    return CacheBackedEmbeddings.from_bytes_store(
+        GoogleGenerativeAIEmbeddings(
+            model="models/embedding-001",
+            google_api_key=api_key
+        ),
+        LocalFileStore(str(EMBEDDING_CACHE_DIR)),
+        namespace="embedding-001"
+    )
+
 class FinancialAnalystBot:
     def __init__(self):
         self.gemini_api_key = None
@@ -83,28 +175,34 @@ class FinancialAnalystBot:
         self.embeddings = None
         self.vectorstore = None
         self.conversation_chain = None
-        self.doc_converter = self.initialize_converter()
+        self.memory = None
+        self._vs_fingerprint = None
+        self._resp_cache = OrderedDict()
+        self.executor = get_conversion_executor()
         
-    def initialize_converter(self):
-        """Initialize the Docling document converter"""
-        pipeline_options = PdfPipelineOptions()
-        pipeline_options.do_ocr = True
-        pipeline_options.do_table_structure = True
-        pipeline_options.table_structure_options.mode = TableFormerMode.ACCURATE
-        pipeline_options.table_structure_options.do_cell_matching = True
-        pipeline_options.accelerator_options = AcceleratorOptions(num_threads=4)
-        pipeline_options.images_scale = 2.0
-        pipeline_options.generate_page_images = True
-
-        return DocumentConverter(
-            format_options={
-                InputFormat.PDF: PdfFormatOption(
-                    pipeline_options=pipeline_options,
-                    backend=PyPdfiumDocumentBackend
-                )
-            }
+    def get_converter(self, do_ocr):
+        """Get the shared converter for the given OCR setting"""
+        return initialize_converter(
+            do_ocr,
+            DOCLING_NUM_THREADS,
+            DOCLING_TABLE_MODE,
+            DOCLING_IMAGES_SCALE
         )
     
+    def needs_ocr(self, pdf_path):
+        """Check whether the PDF lacks a usable text layer on its first page"""
+        import pypdfium2 as pdfium
+        
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            if len(pdf) == 0:
+                return True
+            text = pdf[0].get_textpage().get_text_range()
+        finally:
+            pdf.close()
+        
+        return len(text.strip()) < OCR_TEXT_THRESHOLD
+    
     def setup_gemini(self, api_key):
         """Setup Gemini AI with API key"""
         try:
@@ -117,9 +215,7 @@ class FinancialAnalystBot:
                 temperature=0.1
             )
             
-            self.embeddings = GoogleGenerativeAIEmbeddings(
-                model="models/embedding-001"
-            )
+            self.embeddings = get_embeddings(api_key)
             
             return True
         except Exception as e:
@@ -132,9 +228,27 @@ class FinancialAnalystBot:
             tmp_file.write(uploaded_file.getvalue())
             tmp_path = tmp_file.name
 
+        future = None
         try:
             # Convert the PDF - remove limitations
-            conversion_result = self.doc_converter.convert(tmp_path)
+            # Text-based PDFs already carry a text layer, so OCR is skipped for them
+            converter = self.get_converter(do_ocr=self.needs_ocr(tmp_path))
+            
+            # Run Docling on a worker thread so the UI keeps updating; the worker
+            # owns the temp file until the conversion finishes or is cancelled
+            future = self.executor.submit(converter.convert, tmp_path)
+            future.add_done_callback(lambda _: os.unlink(tmp_path))
+            
+            progress = st.progress(0, text="Mengekstrak isi dokumen...")
+            started = time.time()
+            while not future.done():
+                time.sleep(0.2)
+                # Docling reports no progress, so approach 95% asymptotically
+                elapsed = time.time() - started
+                progress.progress(int(95 * elapsed / (elapsed + 30)), text="Mengekstrak isi dokumen...")
+            progress.empty()
+            
+            conversion_result = future.result()
             
             # Get markdown content
             markdown_content = conversion_result.document.export_to_markdown()
@@ -148,36 +262,121 @@ class FinancialAnalystBot:
             st.error(f"Error processing PDF: {str(e)}")
             return None, None
         finally:
-            os.unlink(tmp_path)
+            if future is None:
+                os.unlink(tmp_path)
+            else:
+                # Drop a conversion still queued behind an earlier one if this run
+                # is interrupted (e.g. a Streamlit rerun); a running one finishes
+                future.cancel()
     
     def extract_financial_data(self, conversion_result):
         """Extract specific financial data from the document"""
+        from docling.utils.export import generate_multimodal_pages
+        
         financial_data = {
             "tables": [],
             "text_segments": []
         }
         
+        texts = []
+        page_nos = []
+        
         try:
             for (content_text, content_md, content_dt, page_cells, page_segments, page) in generate_multimodal_pages(conversion_result):
                 # Extract tables (financial statements, ratios, etc.)
                 if page_cells:
                     financial_data["tables"].extend(page_cells)
                 
-                # Extract all text segments for comprehensive analysis
-                for segment in page_segments:
-                    financial_data["text_segments"].append({
-                        "page": page.page_no,
-                        "content": str(segment),
-                        "type": "financial_data"
-                    })
+                # Collect all text segments for comprehensive analysis;
+                # table and picture segments carry no text
+                page_texts = [
+                    segment["text"].strip()
+                    for segment in page_segments
+                    if segment["text"] is not None
+                ]
+                texts.extend(page_texts)
+                page_nos.extend([page.page_no] * len(page_texts))
         
         except Exception as e:
             st.warning(f"Error extracting financial data: {str(e)}")
         
+        # Drop short segments (page numbers, headers)
+        financial_data["text_segments"] = [
+            {
+                "page": page_no,
+                "content": text,
+                "type": "financial_data"
+            }
+            for page_no, text in zip(page_nos, texts)
+            if len(text) >= MIN_SEGMENT_CHARS
+        ]
+        
         return financial_data
     
+    def embed_texts(self, texts):
+        """Embed texts in concurrent batches, returning vectors in input order"""
+        # Pack length-sorted texts so each batch holds similarly sized inputs
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        
+        batch_indices = []
+        current, current_chars = [], 0
+        for i in order:
+            length = len(texts[i])
+            if current and (
+                len(current) >= EMBED_BATCH_SIZE
+                or current_chars + length > EMBED_BATCH_CHAR_BUDGET
+            ):
+                batch_indices.append(current)
+                current, current_chars = [], 0
+            current.append(i)
+            current_chars += length
+        if current:
+            batch_indices.append(current)
+        
+        batches = [[texts[i] for i in indices] for indices in batch_indices]
+        # Threads on the sync client avoid binding the shared embeddings object's
+        # async channel to a short-lived event loop; map keeps batch order
+        with ThreadPoolExecutor(max_workers=EMBED_MAX_CONCURRENCY) as pool:
+            results = list(pool.map(self.embeddings.embed_documents, batches))
+        
+        # Scatter vectors back to the original text order
+        vectors = [None] * len(texts)
+        for indices, batch_vectors in zip(batch_indices, results):
+            for i, vector in zip(indices, batch_vectors):
+                vectors[i] = vector
+        
+        return vectors
+    
+    def build_hnsw_store(self, chunks, vectors):
+        """Build a FAISS store backed by an HNSW index over 8-bit quantized vectors"""
+        import faiss
+        from langchain_community.vectorstores import FAISS
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+        
+        matrix = np.asarray(vectors, dtype="float32")
+        
+        if len(matrix) >= SQ_MIN_TRAINING_VECTORS:
+            # Store vectors as 8-bit codes: 4x smaller and less memory traffic per search
+            index = faiss.IndexHNSWSQ(matrix.shape[1], faiss.ScalarQuantizer.QT_8bit, HNSW_M)
+            index.train(matrix)
+        else:
+            # Too few vectors to estimate quantizer ranges reliably
+            index = faiss.IndexHNSWFlat(matrix.shape[1], HNSW_M)
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        index.add(matrix)
+        
+        ids = [str(uuid.uuid4()) for _ in chunks]
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=InMemoryDocstore(dict(zip(ids, chunks))),
+            index_to_docstore_id=dict(enumerate(ids))
+        )
+    
     def create_vectorstore(self, documents):
         """Create vector store from documents"""
+        from langchain_community.vectorstores import FAISS
+        
         try:
             text_splitter = RecursiveCharacterTextSplitter(
                 chunk_size=2000,
@@ -186,11 +385,29 @@ class FinancialAnalystBot:
             )
             
             chunks = text_splitter.split_documents(documents)
+            texts = [chunk.page_content for chunk in chunks]
             
-            self.vectorstore = FAISS.from_documents(
-                documents=chunks,
-                embedding=self.embeddings
-            )
+            # Fingerprint the indexed content so cached responses never outlive it
+            fingerprint = hashlib.sha256()
+            for text in texts:
+                fingerprint.update(hashlib.sha256(text.encode("utf-8")).digest())
+            self._vs_fingerprint = fingerprint.hexdigest()
+            
+            # Same content was indexed before: load it instead of re-embedding
+            index_path = INDEX_CACHE_DIR / self._vs_fingerprint
+            if (index_path / "index.faiss").exists():
+                self.vectorstore = FAISS.load_local(
+                    str(index_path),
+                    self.embeddings,
+                    allow_dangerous_deserialization=True
+                )
+                return True
+            
+            # Embed batches concurrently instead of one serial request per chunk
+            vectors = self.embed_texts(texts)
+            
+            self.vectorstore = self.build_hnsw_store(chunks, vectors)
+            self.vectorstore.save_local(str(index_path))
             
             return True
         except Exception as e:
@@ -228,18 +445,33 @@ class FinancialAnalystBot:
                 """
             )
             
-            memory = ConversationBufferMemory(
+            # Rephrases follow-up questions into standalone ones for retrieval
+            condense_prompt = PromptTemplate(
+                input_variables=["chat_history", "input"],
+                template="""Given the following conversation and a follow up question, rephrase the follow up question to be a standalone question, in its original language.
+
+Chat History:
+{chat_history}
+Follow Up Input: {input}
+Standalone question:"""
+            )
+            
+            # Only the most recent turns are kept to bound prompt size
+            self.memory = ConversationBufferWindowMemory(
+                k=5,
                 memory_key="chat_history",
-                return_messages=True,
                 output_key="answer"
             )
             
-            self.conversation_chain = ConversationalRetrievalChain.from_llm(
-                llm=self.llm,
-                retriever=self.vectorstore.as_retriever(search_kwargs={"k": 5}),
-                memory=memory,
-                return_source_documents=True,
-                combine_docs_chain_kwargs={"prompt": financial_prompt}
+            # LCEL chain, so .stream() yields answer tokens as they are generated
+            retriever = create_history_aware_retriever(
+                self.llm,
+                self.vectorstore.as_retriever(search_kwargs={"k": 5}),
+                condense_prompt
+            )
+            self.conversation_chain = create_retrieval_chain(
+                retriever,
+                create_stuff_documents_chain(self.llm, financial_prompt)
             )
             
             return True
@@ -247,13 +479,49 @@ class FinancialAnalystBot:
             st.error(f"Error setting up conversation chain: {str(e)}")
             return False
     
-    def get_response(self, question):
-        """Get response from the chatbot"""
+    def _response_cache_key(self, question):
+        """Build a cache key from the question, chat history and indexed content"""
+        # Only the windowed turns reach the prompt, so only they affect the answer
+        history = [message.content for message in self.memory.buffer_as_messages]
+        payload = json.dumps({
+            "q": question,
+            "hist": history,
+            "vs_id": self._vs_fingerprint
+        })
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def get_response(self, question, placeholder=None):
+        """Get response from the chatbot, streaming tokens into placeholder if given"""
         try:
-            response = self.conversation_chain({"question": question})
-            return response["answer"], response.get("source_documents", [])
+            key = self._response_cache_key(question)
+            if key in self._resp_cache:
+                self._resp_cache.move_to_end(key)
+                answer = self._resp_cache[key]
+                # Keep the conversation history consistent with a live answer
+                self.memory.save_context({"question": question}, {"answer": answer})
+                return answer
+            
+            inputs = {
+                "input": question,
+                "question": question,
+                "chat_history": self.memory.load_memory_variables({})["chat_history"]
+            }
+            
+            answer = ""
+            for chunk in self.conversation_chain.stream(inputs):
+                if "answer" in chunk:
+                    answer += chunk["answer"]
+                    if placeholder:
+                        placeholder.markdown(answer + "▌")
+            
+            self.memory.save_context({"question": question}, {"answer": answer})
+            self._resp_cache[key] = answer
+            # Evict the least recently used answer once the cache is full
+            if len(self._resp_cache) > RESPONSE_CACHE_SIZE:
+                self._resp_cache.popitem(last=False)
+            return answer
         except Exception as e:
-            return f"Error: {str(e)}", []
+            return f"Error: {str(e)}"
 
 def main():
     # Initialize session state
@@ -308,17 +576,18 @@ def main():
                         # Create documents for vector store
                         documents = [Document(page_content=content, metadata={"source": uploaded_file.name})]
                         
-                        # Add financial data segments
+                        # Add financial data segments not already covered by the markdown
                         if financial_data and financial_data["text_segments"]:
-                            for segment in financial_data["text_segments"]:
-                                documents.append(Document(
-                                    page_content=segment["content"],
-                                    metadata={
-                                        "source": uploaded_file.name,
-                                        "page": segment["page"],
-                                        "type": segment["type"]
-                                    }
-                                ))
+                            segments = pd.DataFrame(financial_data["text_segments"])
+                            segments = segments[~segments["content"].str.lower().duplicated()]
+                            segments = segments[~segments["content"].map(content.__contains__)]
+                            segments = segments.assign(source=uploaded_file.name)
+                            
+                            metadatas = segments[["source", "page", "type"]].to_dict("records")
+                            documents.extend(
+                                Document(page_content=text, metadata=metadata)
+                                for text, metadata in zip(segments["content"].values, metadatas)
+                            )
                         
                         if st.session_state.bot.create_vectorstore(documents):
                             if st.session_state.bot.setup_conversation_chain():
@@ -393,9 +662,22 @@ def main():
                 # Add user message
                 st.session_state.messages.append({"role": "user", "content": user_question})
                 
-                # Get bot response
+                # Get bot response, streamed into the chat as it is generated
+                with chat_container:
+                    st.markdown(f"""
+                    <div class="chat-message user-message">
+                        <strong>👤 Anda:</strong><br>
+                        {user_question}
+                    </div>
+                    """, unsafe_allow_html=True)
+                    st.markdown("**🤖 Financial Analyst AI:**")
+                    placeholder = st.empty()
+                
                 with st.spinner("Menganalisis..."):
-                    response, sources = st.session_state.bot.get_response(user_question)
+                    response = st.session_state.bot.get_response(
+                        user_question,
+                        placeholder=placeholder
+                    )
                 
                 # Add bot response
                 st.session_state.messages.append({"role": "assistant", "content": response})
@@ -47,8 +47,10 @@ def main():
     print("📱 Jika tidak terbuka otomatis, buka: http://localhost:8501")
     print("=" * 50)
     
-    # Jalankan streamlit
-    os.system("streamlit run app.py")
+    # Jalankan streamlit di proses ini agar tidak perlu memulai interpreter baru
+    from streamlit.web import bootstrap
+    bootstrap.load_config_options(flag_options={})
+    bootstrap.run("app.py", False, [], flag_options={})
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
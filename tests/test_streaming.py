@@ -0,0 +1,58 @@
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.retrievers import BaseRetriever
+
+import app
+
+
+class FakeRetriever(BaseRetriever):
+    def _get_relevant_documents(self, query, *, run_manager):
+        return [Document(page_content="Laba bersih naik 10% dibanding tahun lalu.")]
+
+
+class FakeVectorStore:
+    def as_retriever(self, **kwargs):
+        return FakeRetriever()
+
+
+class FakePlaceholder:
+    def __init__(self):
+        self.renders = []
+
+    def markdown(self, text):
+        self.renders.append(text)
+
+
+def make_bot(*replies):
+    bot = app.FinancialAnalystBot()
+    bot.llm = GenericFakeChatModel(messages=iter(AIMessage(content=r) for r in replies))
+    bot.vectorstore = FakeVectorStore()
+    assert bot.setup_conversation_chain()
+    return bot
+
+
+def test_answer_tokens_reach_placeholder_incrementally():
+    bot = make_bot("Laba bersih naik sepuluh persen")
+    placeholder = FakePlaceholder()
+
+    answer = bot.get_response("Bagaimana laba perusahaan?", placeholder=placeholder)
+
+    assert answer == "Laba bersih naik sepuluh persen"
+    # One render per streamed token, each extending the previous one
+    assert len(placeholder.renders) > 1
+    assert placeholder.renders[0] == "Laba▌"
+    assert placeholder.renders[-1] == answer + "▌"
+
+
+def test_follow_up_streams_only_the_answer():
+    # The second turn first condenses the question; that output must not be shown
+    bot = make_bot("Jawaban pertama", "Pertanyaan mandiri", "Jawaban kedua")
+    bot.get_response("Pertanyaan pertama?")
+    placeholder = FakePlaceholder()
+
+    answer = bot.get_response("Lalu bagaimana?", placeholder=placeholder)
+
+    assert answer == "Jawaban kedua"
+    assert all("mandiri" not in text for text in placeholder.renders)
+    assert "Jawaban kedua" in bot.memory.load_memory_variables({})["chat_history"]